@@ -1,288 +1,538 @@
-# QUESTION:
-# consider the case where a RIR has a list of AS's which are looking for new IP allocations, 
-# and a list of IP address blocks which are ready to be allocated. Is it possible to allocate these
-# in a way where you optimize network performance / security while not giving bias towards any
-# of the AS's?
-
-# SOLUTION: 
-# Gale-Shapley?
-# We can say that the Gale-shapley algorithm, in the worst case, will NEVER give us a worse pairing than a random pairing between IP blocks and AS's.
-# On the average case, we can say that the Gale-Shapley algorithm will ALWAYS give us the max number of aggregatable pairs possible, given a list of AS's, and a lost of IP blocks.
-
-
-import ipaddress
-import random
-
-#--------------------------------LIST GENERATIONS --------------------------
-
-def random_ip(network):
-    net = ipaddress.ip_network(network)
-    return str(random.choice(list(net.hosts())))
-
-def random_cidr(base_ip):
-    prefix = random.choice(range(22, 30))  # Choosing a random CIDR between /22 and /29
-    return f"{base_ip}/{prefix}"
-
-def generate_as_ip_blocks(num_as, num_blocks):
-    # Define some base networks to randomly pick from
-    base_networks = ['10.0.0.0/16', '172.16.0.0/12', '192.168.0.0/16', '198.51.100.0/24']
-    
-    # Generate Autonomous Systems
-    autonomousSystems = {}
-    for i in range(1, num_as + 1):
-        base_net = random.choice(base_networks)
-        base_ip = random_ip(base_net)
-        cidr = random_cidr(base_ip)
-        autonomousSystems[f'AS{i}'] = cidr
-
-    # Generate IP Blocks
-    ipBlocks = []
-    for i in range(num_blocks):
-        base_net = random.choice(base_networks)
-        base_ip = random_ip(base_net)
-        cidr = random_cidr(base_ip)
-        ipBlocks.append(cidr)
-    
-    return autonomousSystems, ipBlocks
-
-
-def count_aggregations(matchings, autonomousSystems):
-    aggregations = 0
-    for as_id, ip in matchings.items():
-        as_cidr = autonomousSystems[as_id]
-        if can_aggregate(as_cidr, ip):
-            aggregations += 1
-    return aggregations
-
-#-----------------------------END---------------------------------------------
-
-
-
-
-#--------------------AS PREFERENCE DETERMINATION------------------------------
-
-# Determines if 2 blocks can be aggregated.
-def can_aggregate(cidr1, cidr2):
-    # Create network objects for both CIDR blocks
-    network1 = ipaddress.ip_network(cidr1, strict=False)
-    network2 = ipaddress.ip_network(cidr2, strict=False)
-    
-    # Check if either network is a supernet of the other
-    if network1.supernet_of(network2) or network2.supernet_of(network1):
-        return True
-    
-    # Calculate the smallest network that can contain both networks
-    try:
-        # Attempt to create a supernet that is one prefix length shorter than the larger of the two
-        if network1.prefixlen > network2.prefixlen:
-            smaller_prefix = network2.prefixlen
-        else:
-            smaller_prefix = network1.prefixlen
-        
-        # Create supernets and check if they are the same
-        supernet1 = network1.supernet(new_prefix=smaller_prefix-1)
-        supernet2 = network2.supernet(new_prefix=smaller_prefix-1)
-        if supernet1 == supernet2:
-            return True
-    except ValueError:
-        # If it fails (e.g., when trying to create a supernet beyond /0), return False
-        pass
-    
-    return False
-
-
-
-
-# Gets the LCP of 2 networks, in order to help with preference determination.
-def get_common_prefix_length(net1, net2):
-    # Convert network addresses to binary strings
-    bin1 = bin(int(net1.network_address))[2:].zfill(net1.max_prefixlen)
-    bin2 = bin(int(net2.network_address))[2:].zfill(net2.max_prefixlen)
-    
-    # Determine the longest common prefix length
-    lcpl = 0
-    for b1, b2 in zip(bin1, bin2):
-        if b1 == b2:
-            lcpl += 1
-        else:
-            break
-    return lcpl
-
-
-
-# ranks  ip blocks for a given AS, based on difference in prefix, and longest common prefix
-def rank_ip_blocks_for_as(as_cidr, ip_blocks):
-    # Convert the AS CIDR to a network object, correcting for host bits if necessary
-    as_network = ipaddress.ip_network(as_cidr, strict=False)
-    
-    # Create a list of tuples (IP block, total score)
-    ranking = []
-    for ip in ip_blocks:
-        # Correct each IP block for host bits if necessary
-        ip_network = ipaddress.ip_network(ip, strict=False)
-        
-        # Calculate the aggregateability score based on CIDR prefix
-        prefix_diff = abs(as_network.prefixlen - ip_network.prefixlen)
-        aggregateability_score = 32 - prefix_diff  
-        
-        # Calculate network similarity score based on longest common prefix length
-        lcpl = get_common_prefix_length(as_network, ip_network)
-        
-        # Summing up scores: prioritize networks with higher LCPL and similar prefix length
-        total_score = (lcpl * 2) + aggregateability_score  # Weight LCPL more
-        
-        ranking.append((ip, total_score))
-    
-    # Sort the list of tuples by the second item (total score), descending order
-    ranking.sort(key=lambda x: x[1], reverse=True)
-    
-    # Return a list of IP blocks ranked by preference (higher score first)
-    return [ip for ip, score in ranking]
-
-
-#---------------------------END-------------------------------------------------------
-
-
-
-#--------------------IP BLOCK PREFERENCES DETERMINATION-------------------------------
-
-def rank_as_for_ip_blocks(ip_cidr, autonomousSystems):
-    # Convert the IP block CIDR to a network object, correcting for host bits if necessary
-    ip_network = ipaddress.ip_network(ip_cidr, strict=False)
-    
-    # Create a list of tuples (AS ID, total score)
-    ranking = []
-    for as_id, as_cidr in autonomousSystems.items():
-        # Convert the AS CIDR to a network object
-        as_network = ipaddress.ip_network(as_cidr, strict=False)
-        
-        # Calculate the aggregateability score based on CIDR prefix
-        prefix_diff = abs(ip_network.prefixlen - as_network.prefixlen)
-        aggregateability_score = 32 - prefix_diff  # Example for IPv4
-        
-        # Calculate network similarity score based on longest common prefix length
-        lcpl = get_common_prefix_length(ip_network, as_network)
-        
-        # Summing up scores: prioritize AS's with higher LCPL and similar prefix length
-        total_score = (lcpl * 2) + aggregateability_score  # Weight LCPL more
-        
-        ranking.append((as_id, total_score))
-    
-    # Sort the list of tuples by the second item (total score), descending order
-    ranking.sort(key=lambda x: x[1], reverse=True)
-    
-    # Return a list of AS's ranked by preference (higher score first)
-    return [as_id for as_id, score in ranking]
-
-#--------------------END--------------------------------------------------------------
-
-
-
-#----------------------------RANDOM MATCHING GENERATION (to showcase difference in results) -------------------------
-
-# Function to perform random matchings
-def random_match_and_count_aggregations(autonomousSystems, ipBlocks):
-    # Create lists of AS IDs and IP blocks
-    as_ids = list(autonomousSystems.keys())
-    ips = ipBlocks.copy()
-    
-    # Shuffle the IP blocks to ensure randomness
-    random.shuffle(ips)
-    
-    # Match AS IDs to IP blocks directly after shuffling
-    random_matchings = dict(zip(as_ids, ips))
-    
-    # Count aggregateable pairs
-    aggregations = 0
-    for as_id, ip in random_matchings.items():
-        as_cidr = autonomousSystems[as_id]
-        if can_aggregate(as_cidr, ip):
-            aggregations += 1
-            
-    return random_matchings, aggregations
-
-
-#-----------------------------------------END----------------------------------------------------------------
-
-
-
-#-------------------- PROCESS VIEWING----------------------------------------
-
-# print("Autonomous Systems:")
-# for as_id, as_block in autonomousSystems.items():
-#     print(f"{as_id}: {as_block}")
-# print("\nIP Blocks:")
-# for block in ipBlocks:
-#     print(block)
-
-
-# for as_id, as_block in autonomousSystems.items():
-#     preference_list = rank_ip_blocks_for_as(as_block, ipBlocks)
-#     print(f"Preference list for {as_id} based on block {as_block}:")
-#     print(preference_list)
-#     print(can_aggregate(as_block, preference_list[0]))
-#     if(can_aggregate(as_block, preference_list[0]) == True):
-#         aggregations+=1
-#     print()
-
-# for ip_block in ipBlocks:
-#     preference_list = rank_as_for_ip_blocks(ip_block, autonomousSystems)
-#     print(f"Preference list for IP block {ip_block} based on AS's:")
-#     print(preference_list)
-#     print()
-# print(aggregations)
-
-#-----------------------------------END ----------------------------------
-
-
-# Gale-Shapley algorithm
-def gale_shapley(as_prefs, ip_prefs):
-    # Everyone is free initially
-    free_as = list(as_prefs.keys())
-    engagements = {}
-    proposals = {ip: None for ip in ip_prefs}
-
-    while free_as:
-        as_id = free_as.pop(0)
-        for ip in as_prefs[as_id]:
-            if proposals[ip] is None:
-                proposals[ip] = as_id
-                engagements[as_id] = ip
-                break
-            else:
-                current_as = proposals[ip]
-                if ip_prefs[ip].index(as_id) < ip_prefs[ip].index(current_as):
-                    free_as.append(current_as)
-                    proposals[ip] = as_id
-                    engagements[as_id] = ip
-                    if current_as in engagements:
-                        del engagements[current_as]
-                    break
-    return engagements
-
-
-aggregationsSMP = 0
-aggregationsRAND = 0
-
-for i in range(10):
-    autonomousSystems, ipBlocks = generate_as_ip_blocks(10, 10)
-
-    as_prefs = {as_id: rank_ip_blocks_for_as(as_block, ipBlocks) for as_id, as_block in autonomousSystems.items()}
-    ip_prefs = {ip: rank_as_for_ip_blocks(ip, autonomousSystems) for ip in ipBlocks}
-
-    matchings = gale_shapley(as_prefs, ip_prefs)
-    # print("Matchings:")
-    # for as_id, ip in matchings.items():
-    #     print(f"{as_id} is matched with {ip}")
-
-    total_aggregations = count_aggregations(matchings, autonomousSystems)
-    print("Total number of possible aggregations between the pairs:", total_aggregations)
-    aggregationsSMP+= total_aggregations
-
-    random_matchings, total_aggregations = random_match_and_count_aggregations(autonomousSystems, ipBlocks)
-    print("Total number of possible aggregations between the pairs IF RANDOM:", total_aggregations)
-    aggregationsRAND+=total_aggregations
-
-print(str(aggregationsSMP) + " SMP Aggs")
-print(str(aggregationsRAND) + " RAND Aggs")
-
+# QUESTION:
+# consider the case where a RIR has a list of AS's which are looking for new IP allocations, 
+# and a list of IP address blocks which are ready to be allocated. Is it possible to allocate these
+# in a way where you optimize network performance / security while not giving bias towards any
+# of the AS's?
+
+# SOLUTION: 
+# Gale-Shapley?
+# We can say that the Gale-shapley algorithm, in the worst case, will NEVER give us a worse pairing than a random pairing between IP blocks and AS's.
+# On the average case, we can say that the Gale-Shapley algorithm will ALWAYS give us the max number of aggregatable pairs possible, given a list of AS's, and a lost of IP blocks.
+
+
+import functools
+import heapq
+import ipaddress
+import random
+from collections import deque
+from multiprocessing import Pool
+
+# NumPy and Numba are optional accelerators. With neither installed — e.g.
+# under PyPy, whose tracing JIT speeds up the pure-Python loops instead
+# (just run `pypy3 IPAllocToSMP.py`) — every public function falls back to a
+# plain-Python implementation.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+# Parses a CIDR string into an (int network address, prefix length) tuple.
+# The scoring functions only need these two numbers, so there is no reason
+# to pay for full ip_network objects on the hot paths.
+@functools.lru_cache(maxsize=None)
+def parse_cidr(cidr):
+    ip, prefix = cidr.split('/')
+    prefix = int(prefix)
+    p1, p2, p3, p4 = ip.split('.')
+    addr = (int(p1) << 24) | (int(p2) << 16) | (int(p3) << 8) | int(p4)
+    # Mask off the host bits, same as ip_network(..., strict=False) would
+    mask = (0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF
+    return (addr & mask, prefix)
+
+
+# Parses a whole sequence of CIDRs into parallel NumPy arrays of network
+# addresses and prefix lengths, so scoring can be done vectorized. Cached
+# because the driver ranks against the same block/AS lists n times per trial.
+@functools.lru_cache(maxsize=None)
+def _cidrs_to_arrays(cidrs):
+    parsed = [parse_cidr(c) for c in cidrs]
+    addrs = np.array([addr for addr, prefix in parsed], dtype=np.uint32)
+    prefixes = np.array([prefix for addr, prefix in parsed], dtype=np.int32)
+    return addrs, prefixes
+
+
+# Orders indices by descending score. With top_k set, argpartition selects
+# the k best in O(n) and only those get sorted, instead of an O(n log n) sort
+# of the whole list. Folding the index into the sort key keeps tie-breaking
+# identical to the full stable sort, so top_k is always a prefix of it.
+def _ranked_order(scores, top_k=None):
+    if top_k is not None and top_k < len(scores):
+        n = len(scores)
+        key = scores.astype(np.int64) * n - np.arange(n)
+        keep = np.argpartition(-key, top_k - 1)[:top_k]
+        return keep[np.argsort(-key[keep])]
+    return np.argsort(-scores, kind='stable')
+
+
+# Vectorized popcount: SWAR bit-counting in uint32, overridden by the native
+# ufunc on NumPy >= 2.0 (same pattern as the optional _gs_kernel JIT below).
+def _popcount32(x):
+    x = x - ((x >> 1) & 0x55555555)
+    x = (x & 0x33333333) + ((x >> 2) & 0x33333333)
+    x = (x + (x >> 4)) & 0x0F0F0F0F
+    return (x + (x >> 8) + (x >> 16) + (x >> 24)) & 0x3F
+
+
+if np is not None and hasattr(np, 'bitwise_count'):
+    _popcount32 = np.bitwise_count
+
+
+# Vectorized LCP: common prefix lengths of two address arrays (or a scalar
+# against an array — the operands broadcast like any NumPy ufunc inputs).
+def _lcp_lengths(addrs1, addrs2):
+    xor = np.bitwise_xor(np.asarray(addrs1, dtype=np.uint32),
+                         np.asarray(addrs2, dtype=np.uint32))
+    # Smear the highest differing bit down so everything below it is set,
+    # then count the set bits: pure integer bit math, exact for all 32-bit
+    # values, and identical addresses give 32 with no special case
+    xor = xor | (xor >> 1)
+    xor = xor | (xor >> 2)
+    xor = xor | (xor >> 4)
+    xor = xor | (xor >> 8)
+    xor = xor | (xor >> 16)
+    return 32 - _popcount32(xor).astype(np.int32)
+
+#--------------------------------LIST GENERATIONS --------------------------
+
+# Base networks the random addresses are drawn from
+BASE_NETWORKS = ['10.0.0.0/16', '172.16.0.0/12', '192.168.0.0/16', '198.51.100.0/24']
+
+def random_ip(network):
+    net = ipaddress.ip_network(network)
+    return str(random.choice(list(net.hosts())))
+
+def random_cidr(base_ip):
+    prefix = random.choice(range(22, 30))  # Choosing a random CIDR between /22 and /29
+    return f"{base_ip}/{prefix}"
+
+# Draws `count` random CIDRs in one vectorized batch: pick a base network per
+# sample, fill its host bits from one batch of random 32-bit ints, and draw
+# the /22-/29 prefixes in a single call. No per-sample Python loop and no
+# materializing net.hosts() (up to 65k addresses) just to pick one.
+def _random_cidr_arrays(count):
+    base_addrs, base_prefixes = _cidrs_to_arrays(tuple(BASE_NETWORKS))
+    pick = np.random.randint(0, len(BASE_NETWORKS), size=count)
+
+    host_bits = (32 - base_prefixes[pick]).astype(np.uint32)
+    host_mask = np.left_shift(np.uint32(1), host_bits) - np.uint32(1)
+    rand32 = np.random.randint(0, 1 << 32, size=count, dtype=np.uint64).astype(np.uint32)
+
+    addrs = base_addrs[pick] | (rand32 & host_mask)
+    prefixes = np.random.randint(22, 30, size=count).astype(np.int32)  # Random CIDR between /22 and /29
+    return addrs, prefixes
+
+# Formats (addr, prefix) arrays back into CIDR strings at the return boundary.
+def _format_cidrs(addrs, prefixes):
+    return [f'{a >> 24 & 255}.{a >> 16 & 255}.{a >> 8 & 255}.{a & 255}/{p}'
+            for a, p in zip(addrs.tolist(), prefixes.tolist())]
+
+# Pure-Python fallback for _random_cidr_arrays: same distribution, one CIDR
+# string per draw, using only the random module.
+def _random_cidrs_py(count):
+    cidrs = []
+    for _ in range(count):
+        base_addr, base_prefix = parse_cidr(random.choice(BASE_NETWORKS))
+        addr = base_addr | random.getrandbits(32 - base_prefix)
+        prefix = random.randrange(22, 30)  # Random CIDR between /22 and /29
+        cidrs.append(f'{addr >> 24 & 255}.{addr >> 16 & 255}.{addr >> 8 & 255}.{addr & 255}/{prefix}')
+    return cidrs
+
+def generate_as_ip_blocks(num_as, num_blocks):
+    if np is None:
+        as_cidrs = _random_cidrs_py(num_as)
+        ipBlocks = _random_cidrs_py(num_blocks)
+    else:
+        as_cidrs = _format_cidrs(*_random_cidr_arrays(num_as))
+        ipBlocks = _format_cidrs(*_random_cidr_arrays(num_blocks))
+
+    # Generate Autonomous Systems and IP Blocks
+    autonomousSystems = {f'AS{i + 1}': cidr for i, cidr in enumerate(as_cidrs)}
+    return autonomousSystems, ipBlocks
+
+
+# Masks the host bits off a batch of addresses, leaving network addresses —
+# the vectorized counterpart of the addr & mask step in parse_cidr.
+def _mask_to_network(addrs, prefixes):
+    netmask = np.left_shift(np.uint32(0xFFFFFFFF), (32 - prefixes).astype(np.uint32))
+    return addrs & netmask
+
+
+# Structure-of-arrays variant of generate_as_ip_blocks: AS i and block j are
+# just rows i and j of the (addr, prefix) array pairs, with no CIDR strings
+# or dict labels in between. This is the representation the whole fast path
+# (preference matrices, index matcher, aggregation counts) runs on. The
+# addresses are masked to network addresses here, so scoring sees exactly
+# what the string path sees after parse_cidr.
+def generate_as_ip_block_arrays(num_as, num_blocks):
+    as_addrs, as_prefixes = _random_cidr_arrays(num_as)
+    ip_addrs, ip_prefixes = _random_cidr_arrays(num_blocks)
+    return (_mask_to_network(as_addrs, as_prefixes), as_prefixes,
+            _mask_to_network(ip_addrs, ip_prefixes), ip_prefixes)
+
+
+def count_aggregations(matchings, autonomousSystems):
+    aggregations = 0
+    for as_id, ip in matchings.items():
+        as_cidr = autonomousSystems[as_id]
+        if can_aggregate(as_cidr, ip):
+            aggregations += 1
+    return aggregations
+
+
+# Array-form count_aggregations: takes the engaged_as array produced by
+# gale_shapley_indices plus the SoA columns. Two blocks aggregate exactly
+# when they share at least min(p1, p2) - 1 leading bits (either one contains
+# the other, or they are siblings under a common parent), so the whole count
+# is one vectorized LCP comparison over the matched pairs.
+def count_aggregations_indices(engaged_as, as_addrs, as_prefixes, ip_addrs, ip_prefixes):
+    engaged_as = np.asarray(engaged_as)
+    ips = np.nonzero(engaged_as >= 0)[0]
+    ases = engaged_as[ips]
+
+    lcpl = _lcp_lengths(as_addrs[ases], ip_addrs[ips])
+    needed = np.minimum(as_prefixes[ases], ip_prefixes[ips]) - 1
+    return int(np.count_nonzero(lcpl >= needed))
+
+#-----------------------------END---------------------------------------------
+
+
+
+
+#--------------------AS PREFERENCE DETERMINATION------------------------------
+
+# Integer form of the aggregation test. Two blocks can be aggregated when
+# one contains the other or they are siblings under a common parent — in
+# both cases the addresses agree on the top min(prefix1, prefix2) - 1 bits,
+# so a single mask-and-compare replaces the old supernet_of / supernet()
+# object construction and try/except.
+def can_aggregate_int(addr1, prefix1, addr2, prefix2):
+    shared = min(prefix1, prefix2) - 1
+    if shared <= 0:
+        # A /0 or /1 aggregates with anything (the parent is the whole space)
+        return True
+    mask = (0xFFFFFFFF << (32 - shared)) & 0xFFFFFFFF
+    return (addr1 & mask) == (addr2 & mask)
+
+
+# Determines if 2 blocks can be aggregated.
+def can_aggregate(cidr1, cidr2):
+    addr1, prefix1 = parse_cidr(cidr1)
+    addr2, prefix2 = parse_cidr(cidr2)
+    return can_aggregate_int(addr1, prefix1, addr2, prefix2)
+
+
+
+
+# Gets the LCP of 2 network addresses (as ints), in order to help with preference determination.
+def get_common_prefix_length(addr1, addr2):
+    # The common prefix is everything above the highest differing bit, so a
+    # single XOR + bit_length replaces the old binary-string comparison loop
+    return 32 - (addr1 ^ addr2).bit_length()
+
+
+
+# Pure-Python scoring loop shared by both rankers' fallback paths.
+def _rank_py(addr, prefix, candidates, top_k):
+    ranking = []
+    for key, cidr in candidates:
+        cand_addr, cand_prefix = parse_cidr(cidr)
+        lcpl = get_common_prefix_length(addr, cand_addr)
+        ranking.append((key, (lcpl * 2) + (32 - abs(prefix - cand_prefix))))
+    if top_k is not None and top_k < len(ranking):
+        # nlargest is a partial sort with the same stable ordering as sorted()
+        ranking = heapq.nlargest(top_k, ranking, key=lambda x: x[1])
+    else:
+        ranking.sort(key=lambda x: x[1], reverse=True)
+    return [key for key, score in ranking]
+
+
+# ranks  ip blocks for a given AS, based on difference in prefix, and longest common prefix
+def rank_ip_blocks_for_as(as_cidr, ip_blocks, top_k=None):
+    # Parse the AS CIDR down to its network address and prefix length
+    as_addr, as_prefix = parse_cidr(as_cidr)
+    if np is None:
+        return _rank_py(as_addr, as_prefix, [(ip, ip) for ip in ip_blocks], top_k)
+    ip_addrs, ip_prefixes = _cidrs_to_arrays(tuple(ip_blocks))
+
+    # Score every block at once: prioritize blocks with higher LCPL
+    # and similar prefix length (LCPL weighted more)
+    lcpl = _lcp_lengths(as_addr, ip_addrs)
+    scores = (lcpl * 2) + (32 - np.abs(as_prefix - ip_prefixes))
+
+    # Return a list of IP blocks ranked by preference (higher score first),
+    # truncated to the top_k best when the caller only needs a shortlist
+    order = _ranked_order(scores, top_k)
+    return [ip_blocks[i] for i in order]
+
+
+#---------------------------END-------------------------------------------------------
+
+
+
+#--------------------IP BLOCK PREFERENCES DETERMINATION-------------------------------
+
+def rank_as_for_ip_blocks(ip_cidr, autonomousSystems, top_k=None):
+    # Parse the IP block CIDR down to its network address and prefix length
+    ip_addr, ip_prefix = parse_cidr(ip_cidr)
+    if np is None:
+        return _rank_py(ip_addr, ip_prefix, list(autonomousSystems.items()), top_k)
+    as_ids = list(autonomousSystems.keys())
+    as_addrs, as_prefixes = _cidrs_to_arrays(tuple(autonomousSystems.values()))
+
+    # Score every AS at once: prioritize AS's with higher LCPL
+    # and similar prefix length (LCPL weighted more)
+    lcpl = _lcp_lengths(ip_addr, as_addrs)
+    scores = (lcpl * 2) + (32 - np.abs(ip_prefix - as_prefixes))
+
+    # Return a list of AS's ranked by preference (higher score first),
+    # truncated to the top_k best when the caller only needs a shortlist
+    order = _ranked_order(scores, top_k)
+    return [as_ids[i] for i in order]
+
+
+# Builds both sides' preference matrices in one shot from the SoA columns.
+# Instead of n separate ranking calls per side, one broadcast computes the
+# full n_as x n_ip score matrix and two argsorts produce integer preference
+# orders over row/column indices, ready for gale_shapley_indices.
+def build_preference_matrices_from_arrays(as_addrs, as_prefixes, ip_addrs, ip_prefixes):
+    # Same scoring as the per-item rankers, broadcast over all pairs
+    lcpl = _lcp_lengths(as_addrs[:, None], ip_addrs[None, :])
+    scores = (lcpl * 2) + (32 - np.abs(as_prefixes[:, None] - ip_prefixes[None, :]))
+
+    # Row i of as_prefs_idx is AS i's blocks in preference order; row j of
+    # ip_prefs_idx is block j's AS's in preference order
+    as_prefs_idx = np.argsort(-scores, axis=1, kind='stable')
+    ip_prefs_idx = np.argsort(-scores.T, axis=1, kind='stable')
+    return as_prefs_idx, ip_prefs_idx
+
+
+# String-CIDR convenience wrapper around the array form.
+def build_preference_matrices(as_cidrs, ip_cidrs):
+    return build_preference_matrices_from_arrays(*_cidrs_to_arrays(tuple(as_cidrs)),
+                                                 *_cidrs_to_arrays(tuple(ip_cidrs)))
+
+#--------------------END--------------------------------------------------------------
+
+
+
+#----------------------------RANDOM MATCHING GENERATION (to showcase difference in results) -------------------------
+
+# Function to perform random matchings
+def random_match_and_count_aggregations(autonomousSystems, ipBlocks):
+    # Create lists of AS IDs and IP blocks
+    as_ids = list(autonomousSystems.keys())
+    ips = ipBlocks.copy()
+    
+    # Shuffle the IP blocks to ensure randomness
+    random.shuffle(ips)
+    
+    # Match AS IDs to IP blocks directly after shuffling
+    random_matchings = dict(zip(as_ids, ips))
+    
+    # Count aggregateable pairs
+    aggregations = 0
+    for as_id, ip in random_matchings.items():
+        as_cidr = autonomousSystems[as_id]
+        if can_aggregate(as_cidr, ip):
+            aggregations += 1
+            
+    return random_matchings, aggregations
+
+
+# Array-form random matching: AS i gets block perm[i], and the aggregation
+# count is the same vectorized LCP test used by count_aggregations_indices.
+def random_match_and_count_aggregations_indices(as_addrs, as_prefixes, ip_addrs, ip_prefixes):
+    k = min(len(as_addrs), len(ip_addrs))
+    perm = np.random.permutation(len(ip_addrs))[:k]
+
+    lcpl = _lcp_lengths(as_addrs[:k], ip_addrs[perm])
+    needed = np.minimum(as_prefixes[:k], ip_prefixes[perm]) - 1
+    aggregations = int(np.count_nonzero(lcpl >= needed))
+    return perm, aggregations
+
+
+#-----------------------------------------END----------------------------------------------------------------
+
+
+
+#-------------------- PROCESS VIEWING----------------------------------------
+
+# print("Autonomous Systems:")
+# for as_id, as_block in autonomousSystems.items():
+#     print(f"{as_id}: {as_block}")
+# print("\nIP Blocks:")
+# for block in ipBlocks:
+#     print(block)
+
+
+# for as_id, as_block in autonomousSystems.items():
+#     preference_list = rank_ip_blocks_for_as(as_block, ipBlocks)
+#     print(f"Preference list for {as_id} based on block {as_block}:")
+#     print(preference_list)
+#     print(can_aggregate(as_block, preference_list[0]))
+#     if(can_aggregate(as_block, preference_list[0]) == True):
+#         aggregations+=1
+#     print()
+
+# for ip_block in ipBlocks:
+#     preference_list = rank_as_for_ip_blocks(ip_block, autonomousSystems)
+#     print(f"Preference list for IP block {ip_block} based on AS's:")
+#     print(preference_list)
+#     print()
+# print(aggregations)
+
+#-----------------------------------END ----------------------------------
+
+
+# Gale-Shapley algorithm
+def gale_shapley(as_prefs, ip_prefs):
+    # Precompute each IP block's ranking of the AS's once, so preference
+    # comparisons are O(1) dict lookups instead of O(n) list scans
+    ip_rank = {ip: {as_id: i for i, as_id in enumerate(prefs)} for ip, prefs in ip_prefs.items()}
+
+    # Everyone is free initially
+    free_as = deque(as_prefs.keys())
+    engagements = {}
+    proposals = {ip: None for ip in ip_prefs}
+
+    # Each AS remembers where it left off in its preference list, so a
+    # bumped AS resumes proposing instead of restarting from the top
+    next_prop = {as_id: 0 for as_id in as_prefs}
+
+    while free_as:
+        as_id = free_as.popleft()
+        prefs = as_prefs[as_id]
+        while next_prop[as_id] < len(prefs):
+            ip = prefs[next_prop[as_id]]
+            next_prop[as_id] += 1
+            if proposals[ip] is None:
+                proposals[ip] = as_id
+                engagements[as_id] = ip
+                break
+            else:
+                current_as = proposals[ip]
+                if ip_rank[ip][as_id] < ip_rank[ip][current_as]:
+                    free_as.append(current_as)
+                    proposals[ip] = as_id
+                    engagements[as_id] = ip
+                    if current_as in engagements:
+                        del engagements[current_as]
+                    break
+    return engagements
+
+
+# The proposer loop as a pure integer kernel: engaged_as / next_prop are flat
+# int arrays and the free list is a fixed-size stack (each AS is either
+# engaged, in the stack, or out of proposals, so n_as slots always suffice).
+def _gs_kernel(as_prefs_idx, ip_rank):
+    n_as, n_ip = as_prefs_idx.shape
+    engaged_as = np.full(n_ip, -1, dtype=np.int32)
+    next_prop = np.zeros(n_as, dtype=np.int32)
+    stack = np.empty(n_as, dtype=np.int32)
+    for i in range(n_as):
+        stack[i] = i
+    top = n_as
+
+    while top > 0:
+        top -= 1
+        as_id = stack[top]
+        while next_prop[as_id] < n_ip:
+            ip = as_prefs_idx[as_id, next_prop[as_id]]
+            next_prop[as_id] += 1
+            current_as = engaged_as[ip]
+            if current_as == -1:
+                engaged_as[ip] = as_id
+                break
+            elif ip_rank[ip, as_id] < ip_rank[ip, current_as]:
+                engaged_as[ip] = as_id
+                stack[top] = current_as
+                top += 1
+                break
+    return engaged_as
+
+
+if njit is not None:
+    # Compile eagerly for the exact types the driver always passes
+    # (C-contiguous int64 matrices from argsort, int32 result) instead of
+    # lazily on first call: the specialization is fixed at import, so none of
+    # the pool workers pays JIT latency or type dispatch inside its trials,
+    # and with cache=True the machine code persists across runs.
+    from numba import int32, int64
+    _gs_kernel = njit(int32[::1](int64[:, ::1], int64[:, ::1]), cache=True)(_gs_kernel)
+
+
+# Gale-Shapley over the integer preference matrices from
+# build_preference_matrices. Works purely on row/column indices 0..n-1, so
+# there is no string hashing or dict-of-list bookkeeping in the hot loop.
+# Returns an array where engaged_as[ip] is the AS index holding block ip
+# (-1 if unmatched).
+def gale_shapley_indices(as_prefs_idx, ip_prefs_idx):
+    n_as, n_ip = as_prefs_idx.shape
+
+    # Invert each block's preference row into a rank table for O(1) comparisons
+    ip_rank = np.empty_like(ip_prefs_idx)
+    ip_rank[np.arange(n_ip)[:, None], ip_prefs_idx] = np.arange(n_as)[None, :]
+
+    return _gs_kernel(np.ascontiguousarray(as_prefs_idx), np.ascontiguousarray(ip_rank))
+
+
+NUM_TRIALS = 10
+TRIAL_SIZE = 10
+
+
+# One independent generate -> rank -> match -> count trial. Takes an explicit
+# seed so each pool worker draws its own data instead of every fork replaying
+# the inherited RNG state. Returns (SMP aggregations, random aggregations).
+def run_trial(seed):
+    random.seed(seed)
+    if np is None:
+        # Pure-Python pipeline over CIDR strings (the PyPy-friendly path)
+        autonomousSystems, ipBlocks = generate_as_ip_blocks(TRIAL_SIZE, TRIAL_SIZE)
+        as_prefs = {as_id: rank_ip_blocks_for_as(as_block, ipBlocks) for as_id, as_block in autonomousSystems.items()}
+        ip_prefs = {ip: rank_as_for_ip_blocks(ip, autonomousSystems) for ip in ipBlocks}
+        matchings = gale_shapley(as_prefs, ip_prefs)
+        smp_aggregations = count_aggregations(matchings, autonomousSystems)
+        random_matchings, rand_aggregations = random_match_and_count_aggregations(autonomousSystems, ipBlocks)
+        return smp_aggregations, rand_aggregations
+
+    np.random.seed(seed)
+
+    as_addrs, as_prefixes, ip_addrs, ip_prefixes = generate_as_ip_block_arrays(TRIAL_SIZE, TRIAL_SIZE)
+
+    as_prefs_idx, ip_prefs_idx = build_preference_matrices_from_arrays(as_addrs, as_prefixes, ip_addrs, ip_prefixes)
+
+    engaged_as = gale_shapley_indices(as_prefs_idx, ip_prefs_idx)
+    # print("Matchings:")
+    # for ip, a in enumerate(engaged_as):
+    #     if a != -1:
+    #         print(f"AS{a + 1} is matched with {_format_cidrs(ip_addrs[ip:ip+1], ip_prefixes[ip:ip+1])[0]}")
+
+    smp_aggregations = count_aggregations_indices(engaged_as, as_addrs, as_prefixes, ip_addrs, ip_prefixes)
+
+    random_matchings, rand_aggregations = random_match_and_count_aggregations_indices(as_addrs, as_prefixes, ip_addrs, ip_prefixes)
+
+    return smp_aggregations, rand_aggregations
+
+
+if __name__ == '__main__':
+    # The trials are fully independent, so fan them out across cores
+    with Pool() as pool:
+        results = pool.map(run_trial, range(NUM_TRIALS))
+
+    aggregationsSMP = 0
+    aggregationsRAND = 0
+    for smp_aggregations, rand_aggregations in results:
+        print("Total number of possible aggregations between the pairs:", smp_aggregations)
+        aggregationsSMP += smp_aggregations
+        print("Total number of possible aggregations between the pairs IF RANDOM:", rand_aggregations)
+        aggregationsRAND += rand_aggregations
+
+    print(str(aggregationsSMP) + " SMP Aggs")
+    print(str(aggregationsRAND) + " RAND Aggs")
+